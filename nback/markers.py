@@ -2,8 +2,6 @@ from __future__ import annotations
 
 from typing import Optional
 
-from psychopy import core
-
 # Toggle markers here
 ENABLE_MARKERS = False
 
@@ -59,6 +57,7 @@ def send_marker(code: int, info: Optional[dict] = None) -> None:
     # ser.write(bytes([int(code) & 0xFF]))
 
     # --- Parallel port send ---
+    # from psychopy import core
     # p = _get_parallel_port()
     # p.setData(int(code) & 0xFF)
     # core.wait(0.005)
@@ -1,11 +1,36 @@
 from __future__ import annotations
 
+import os
 import random
-import string
+import warnings
+from bisect import bisect
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Tuple
+from itertools import accumulate, compress, islice, repeat
+from operator import eq, ne
+from typing import Any, List, Optional, Protocol, Sequence, Set, Tuple
 
-LETTERS = [c for c in string.ascii_uppercase if c not in {"I", "O", "Q"}]
+from nback.markers import (
+    MARK_STIM_LURE_N_MINUS_1,
+    MARK_STIM_LURE_N_PLUS_1,
+    MARK_STIM_NONTARGET,
+    MARK_STIM_TARGET,
+)
+
+# A-Z without the confusable I, O and Q
+LETTERS: Tuple[str, ...] = tuple("ABCDEFGHJKLMNPRSTUVWXYZ")
+# The generator works on letter codes (positions in LETTERS) and decodes to
+# strings only when building TrialPlans
+_LETTER_CODES = list(range(len(LETTERS)))
+
+# Lure type codes used inside the generator; _LURE_NAMES decodes them to the
+# TrialPlan.lure_type strings
+_LURE_NONE = 0
+_LURE_NM1 = 1
+_LURE_NP1 = 2
+_LURE_NAMES = ("none", "n-1", "n+1")
+# Stimulus marker per lure code for non-target trials (targets use MARK_STIM_TARGET)
+_LURE_MARKERS = (MARK_STIM_NONTARGET, MARK_STIM_LURE_N_MINUS_1, MARK_STIM_LURE_N_PLUS_1)
 
 TARGET_RATE = 0.30
 LURE_N_MINUS_1_RATE = 0.05
@@ -15,63 +40,105 @@ MAX_ATTEMPTS = 300
 MAX_CONSEC_TARGETS_DEFAULT = 1
 ITI_JITTER_RANGE_MS = (500, 900)
 
-@dataclass
+
+class _RandomSource(Protocol):
+    """The random methods the generator draws from. Both random.Random instances
+    and the random module itself (the global state random.seed() controls) fit.
+    """
+
+    def random(self) -> float: ...
+    def choice(self, seq: Sequence[Any]) -> Any: ...
+    def choices(self, population: Sequence[Any], *, k: int = 1) -> List[Any]: ...
+    def sample(self, population: Sequence[Any], k: int) -> List[Any]: ...
+    def getrandbits(self, k: int) -> int: ...
+
+
+def _seq_workers_from_env() -> int:
+    """NBACK_SEQ_WORKERS as a worker count; unset or invalid values disable workers."""
+    raw = os.environ.get("NBACK_SEQ_WORKERS", "").strip()
+    if not raw:
+        return 0
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        warnings.warn(f"Ignoring NBACK_SEQ_WORKERS={raw!r} (not an integer); generating in-process",
+                      RuntimeWarning, stacklevel=2)
+        return 0
+
+
+# Worker processes for unseeded generation (NBACK_SEQ_WORKERS, off by default).
+# Meant for offline use with hard constraint settings, not the live session.
+SEQ_WORKERS = _seq_workers_from_env()
+
+
+@dataclass(slots=True, frozen=True)
 class TrialPlan:
     stimulus: str
     is_target: int
     lure_type: str
     iti_ms: int
+    marker_code: int = 0
 
 
-def _choose_letter(candidates: List[str], freq: Dict[str, int], soft_balance: bool = True) -> str:
+def _choose_letter(rng: _RandomSource, candidates: List[int], weights: List[int],
+                   soft_balance: bool = True) -> int:
+    """Pick a letter code, favouring under-used ones when soft_balance is set.
+    weights is indexed by letter code and holds (max count - count + 1) per
+    letter; the caller keeps it current as letters are appended.
+    """
     if not candidates:
-        candidates = LETTERS[:]
+        candidates = _LETTER_CODES
     if soft_balance:
-        max_count = max(freq.values()) if freq else 1
-        weights = [(max_count - freq.get(c, 0) + 1) for c in candidates]
-        weights = [max(w, 1) for w in weights]
-        total = float(sum(weights))
-        r = random.random() * total
-        acc = 0.0
-        for c, w in zip(candidates, weights):
-            acc += w
-            if r <= acc:
-                return c
-        return candidates[-1]
-    return random.choice(candidates)
-
-
-def _valid_run_limit(seq: List[str], candidate: str, max_run: int) -> bool:
-    if max_run <= 0:
-        return True
-    run_len = 1
-    i = len(seq) - 1
-    while i >= 0 and seq[i] == candidate:
-        run_len += 1
-        i -= 1
-    return run_len <= max_run
-
-
-def validate_sequence(seq: List[str], is_target_flags: List[int], lure_types: List[str], *,
+        if candidates is not _LETTER_CODES:
+            weights = [weights[c] for c in candidates]
+        cum = list(accumulate(weights))
+        return candidates[bisect(cum, rng.random() * cum[-1])]
+    return rng.choice(candidates)
+
+
+def _letters_excluding(skip: Set[int]) -> List[int]:
+    """All letter codes minus skip, in LETTERS order (keeps seeded draws reproducible)."""
+    if not skip:
+        return _LETTER_CODES
+    return [c for c in _LETTER_CODES if c not in skip]
+
+
+def validate_sequence(seq: Sequence, is_target_flags: Sequence[int], lure_types: List[str], *,
                       n_back: int, target_rate: float, tolerance: int,
-                      max_consec_targets: int) -> Tuple[bool, str]:
+                      max_consec_targets: int,
+                      total_targets: Optional[int] = None) -> Tuple[bool, str]:
+    """Check a sequence against the task constraints; returns (ok, reason).
+    Checks run cheapest first. Callers that already counted the targets can
+    pass total_targets to skip the counting pass.
+    """
     n_trials = len(seq)
-    if any(is_target_flags[i] == 1 for i in range(0, min(n_back, n_trials))):
-        return False, "Target in first N trials"
     desired_targets = round(target_rate * n_trials)
-    total_targets = sum(is_target_flags)
-    if not (desired_targets - 1 <= total_targets <= desired_targets + 1):
-        return False, f"Target count {total_targets} outside ±1 around {desired_targets}"
+    # 0/1 flags as bytes: counting and run search happen in C
+    flags = bytes(is_target_flags)
+    if total_targets is None:
+        total_targets = flags.count(1)
+    if not (desired_targets - tolerance <= total_targets <= desired_targets + tolerance):
+        return False, f"Target count {total_targets} outside ±{tolerance} around {desired_targets}"
+    if 1 in flags[:n_back]:
+        return False, "Target in first N trials"
+    if b"\x01" * (max_consec_targets + 1) in flags:
+        return False, f">{max_consec_targets} consecutive targets"
+    # A trial repeats the letter n_back back exactly when it is flagged as a target
+    if bytes(map(eq, islice(seq, n_back, None), seq)) != flags[n_back:]:
+        return False, "Target flags do not match n-back repeats"
     if n_back > 1:
-        for i in range(1, n_trials):
-            if seq[i] == seq[i - 1] and is_target_flags[i] == 0 and lure_types[i] == "none":
+        # Indices i with seq[i] == seq[i - 1]; the element-wise compare runs in C
+        repeats = compress(range(1, n_trials), map(eq, seq, islice(seq, 1, None)))
+        for i in repeats:
+            if flags[i] == 0 and lure_types[i] == "none":
                 return False, "Immediate repeat without target/lure"
-    for i in range(n_trials):
+    # Only lure trials need the per-trial checks below
+    for i in compress(range(n_trials), map(ne, lure_types, repeat("none"))):
         lt = lure_types[i]
         if lt == "n-1":
             if not (i >= n_back - 1 and (n_back - 1) > 0):
                 return False, "n-1 lure too early"
-            if is_target_flags[i] == 1:
+            if flags[i] == 1:
                 return False, "lure double-counted as target"
             if seq[i] != seq[i - (n_back - 1)]:
                 return False, "n-1 lure mismatch"
@@ -80,62 +147,153 @@ def validate_sequence(seq: List[str], is_target_flags: List[int], lure_types: Li
         elif lt == "n+1":
             if not (i >= n_back + 1):
                 return False, "n+1 lure too early"
-            if is_target_flags[i] == 1:
+            if flags[i] == 1:
                 return False, "lure double-counted as target"
             if seq[i] != seq[i - (n_back + 1)]:
                 return False, "n+1 lure mismatch"
             if i >= n_back and seq[i] == seq[i - n_back]:
                 return False, "n+1 lure equals target"
-    consec = 0
-    for f in is_target_flags:
-        if f == 1:
-            consec += 1
-            if consec > max_consec_targets:
-                return False, f">{max_consec_targets} consecutive targets"
-        else:
-            consec = 0
     return True, "ok"
 
 
-def _sample_target_indices(n_back: int, n_trials: int, desired: int, max_consec_targets: int, *, attempts: int = 200) -> Optional[List[int]]:
-    """Randomly choose target indices >= n_back satisfying:
-    - No more than max_consec_targets consecutive targets
-    - No N-back chaining: i and i-n_back cannot both be targets (breaks repeating N-back cycles)
+def _sample_target_indices(rng: _RandomSource, n_back: int, n_trials: int, desired: int, max_consec_targets: int, *,
+                           tolerance: int = 0, attempts: int = 200) -> Optional[List[int]]:
+    """Randomly choose target indices >= n_back with no more than
+    max_consec_targets consecutive targets.
+    Each attempt is a single pass over the positions in random order, accepting
+    every position that is still feasible; it stops as soon as `desired` are placed.
+    If no attempt places exactly `desired` (e.g. in very short blocks), the fullest
+    layout is used when it is within `tolerance` of `desired`.
     Returns sorted indices or None on failure.
     """
     if desired <= 0:
         return []
-    positions = list(range(n_back, n_trials))
+    positions = range(n_back, n_trials)
+    sample = rng.sample
+    best: Set[int] = set()
     for _ in range(attempts):
-        random.shuffle(positions)
-        chosen: List[int] = []
-        for i in positions:
-            if len(chosen) >= desired:
-                break
-            # Consecutive target constraint
-            if max_consec_targets <= 0:
-                allow = False
-            else:
-                if max_consec_targets == 1 and chosen and i - chosen[-1] == 1:
-                    continue
-                # General case: ensure last run length would not exceed max
-                if chosen:
-                    run = 1
-                    j = len(chosen) - 1
-                    while j >= 0 and chosen[j] == (i - (len(chosen) - j)):
-                        run += 1
-                        j -= 1
-                    if run > max_consec_targets:
-                        continue
-            # Break chains: do not select i if (i - n_back) already a target
-            if (i - n_back) in chosen:
+        chosen: Set[int] = set()
+        for i in sample(positions, len(positions)):
+            # Length of the target run i would complete (neighbours on both sides)
+            left = i - 1
+            while left in chosen:
+                left -= 1
+            right = i + 1
+            while right in chosen:
+                right += 1
+            if right - left - 1 > max_consec_targets:
                 continue
-            chosen.append(i)
-        if len(chosen) == desired:
-            return sorted(chosen)
+            chosen.add(i)
+            if len(chosen) == desired:
+                return sorted(chosen)
+        if len(chosen) > len(best):
+            best = chosen
+    if len(best) >= desired - tolerance:
+        return sorted(best)
     return None
 
 
+def _build_attempt(rng: _RandomSource, n_back: int, n_trials: int, desired_targets: int, *,
+                   lure_n_minus_1_rate: float, lure_n_plus_1_rate: float,
+                   max_consec_targets: int, tolerance: int, run_cap: int,
+                   soft_balance: bool, include_lures: bool
+                   ) -> Optional[Tuple[bytearray, bytearray, bytearray, int]]:
+    """One constructive pass over all trials.
+    Returns (seq, is_target_flags, lure_codes, n_targets) as bytearrays of letter
+    codes, 0/1 target flags and _LURE_* codes, or None if no target layout was found
+    or a target would break the run limit. Every other constraint holds by
+    construction, so the result passes validate_sequence.
+    """
+    seq = bytearray()
+    is_target_flags = bytearray()
+    lure_codes = bytearray()
+    # Soft-balance weights per letter code: (max count - count + 1)
+    weights = [1] * len(LETTERS)
+    # Identical-letter run at the tail of seq, kept in step with appends
+    run_letter: Optional[int] = None
+    run_len = 0
+
+    target_indices = _sample_target_indices(rng, n_back, n_trials, desired_targets, max_consec_targets,
+                                            tolerance=tolerance)
+    if target_indices is None:
+        return None
+    target_set = set(target_indices)
+    # Lure coin flips are drawn only on non-target trials that can take that lure
+    rand = rng.random
+    use_nm1 = include_lures and n_back > 1 and lure_n_minus_1_rate > 0.0
+    use_np1 = include_lures and lure_n_plus_1_rate > 0.0
+
+    # _sample_target_indices only draws from range(n_back, n_trials)
+    assert min(target_set, default=n_back) >= n_back
+
+    for i in range(n_trials):
+        planned_lure_type = _LURE_NONE
+        # Letter a target at i + 1 will repeat; a lure must not extend a run it would overflow
+        next_target_letter = seq[i + 1 - n_back] if n_back > 1 and i + 1 in target_set else None
+        # Target placement by pre-sampled indices: letter must match n-back
+        if i in target_set:
+            letter = seq[i - n_back]
+            is_target_flags.append(1)
+            lure_codes.append(_LURE_NONE)
+        else:
+            # Optionally place a lure on non-target trials
+            if include_lures:
+                # n-1 lure
+                if use_nm1 and i >= (n_back - 1) and rand() < lure_n_minus_1_rate:
+                    letter_nm1 = seq[i - (n_back - 1)]
+                    letter_n = seq[i - n_back] if i >= n_back else None
+                    lure_run = run_len + 1 if letter_nm1 == run_letter else 1
+                    if ((letter_n is None or letter_nm1 != letter_n) and lure_run <= run_cap
+                            and (letter_nm1 != next_target_letter or lure_run < run_cap)):
+                        planned_lure_type = _LURE_NM1
+                        letter = letter_nm1
+                    else:
+                        planned_lure_type = _LURE_NONE
+                # n+1 lure
+                if planned_lure_type == _LURE_NONE and use_np1 and i >= (n_back + 1) and rand() < lure_n_plus_1_rate:
+                    letter_np1 = seq[i - (n_back + 1)]
+                    letter_n = seq[i - n_back] if i >= n_back else None
+                    lure_run = run_len + 1 if letter_np1 == run_letter else 1
+                    if ((letter_n is None or letter_np1 != letter_n) and lure_run <= run_cap
+                            and (letter_np1 != next_target_letter or lure_run < run_cap)):
+                        planned_lure_type = _LURE_NP1
+                        letter = letter_np1
+                    else:
+                        planned_lure_type = _LURE_NONE
+            # If still none, choose a regular non-target letter
+            if planned_lure_type == _LURE_NONE:
+                skip = set()
+                if i >= n_back:
+                    skip.add(seq[i - n_back])
+                if i:
+                    # Repeating the previous letter would be an unlabelled immediate repeat
+                    skip.add(run_letter)
+                candidates = _letters_excluding(skip)
+                letter = _choose_letter(rng, candidates, weights, soft_balance=soft_balance)
+            is_target_flags.append(0)
+            lure_codes.append(planned_lure_type)
+
+        # Lures and plain letters respect the run limit by construction; a target
+        # cannot be changed without breaking it, so the attempt is dropped here
+        if letter == run_letter and run_len >= run_cap:
+            return None
+
+        seq.append(letter)
+        if letter == run_letter:
+            run_len += 1
+        else:
+            run_letter, run_len = letter, 1
+        if weights[letter] == 1:
+            # letter was (one of) the most used: its count sets a new maximum,
+            # which raises every other letter's weight by one
+            weights = [w + 1 for w in weights]
+            weights[letter] = 1
+        else:
+            weights[letter] -= 1
+
+    return seq, is_target_flags, lure_codes, len(target_set)
+
+
 def generate_sequence(n_back: int, n_trials: int, *,
                       target_rate: float = TARGET_RATE,
                       lure_n_minus_1_rate: float = LURE_N_MINUS_1_RATE,
@@ -145,115 +303,125 @@ def generate_sequence(n_back: int, n_trials: int, *,
                       iti_range_ms: Tuple[int, int] = ITI_JITTER_RANGE_MS,
                       max_attempts: int = MAX_ATTEMPTS,
                       soft_balance_initial: bool = True,
-                      include_lures: bool = True) -> List[TrialPlan]:
-    tolerance = 1
-    desired_targets = round(target_rate * n_trials)
-
-    for _attempt in range(1, max_attempts + 1):
-        seq: List[str] = []
-        is_target_flags: List[int] = []
-        lure_types: List[str] = []
-        freqs: Dict[str, int] = {c: 0 for c in LETTERS}
-
-        target_indices = _sample_target_indices(n_back, n_trials, desired_targets, max_consec_targets)
-        if target_indices is None:
-            continue
-        target_set = set(target_indices)
-
-        for i in range(n_trials):
-            iti_ms = random.randint(iti_range_ms[0], iti_range_ms[1])
-            planned_lure_type = "none"
-            # Target placement by pre-sampled indices
-            if i in target_set and i >= n_back:
-                # Letter must match n-back
-                if i >= n_back:
-                    letter = seq[i - n_back]
-                else:
-                    # Should not happen as indices start at n_back
-                    letter = _choose_letter(LETTERS, freqs, soft_balance=soft_balance_initial)
-                is_target_flags.append(1)
-                lure_types.append("none")
-            else:
-                # Optionally place a lure on non-target trials
-                if include_lures:
-                    # n-1 lure
-                    if (n_back - 1) > 0 and i >= (n_back - 1) and random.random() < lure_n_minus_1_rate:
-                        letter_nm1 = seq[i - (n_back - 1)]
-                        letter_n = seq[i - n_back] if i >= n_back else None
-                        if letter_nm1 and (letter_n is None or letter_nm1 != letter_n) and _valid_run_limit(seq, letter_nm1, max_identical_run):
-                            planned_lure_type = "n-1"
-                            letter = letter_nm1
-                        else:
-                            planned_lure_type = "none"
-                    # n+1 lure
-                    if planned_lure_type == "none" and i >= (n_back + 1) and random.random() < lure_n_plus_1_rate:
-                        letter_np1 = seq[i - (n_back + 1)]
-                        letter_n = seq[i - n_back] if i >= n_back else None
-                        if letter_np1 and (letter_n is None or letter_np1 != letter_n) and _valid_run_limit(seq, letter_np1, max_identical_run):
-                            planned_lure_type = "n+1"
-                            letter = letter_np1
-                        else:
-                            planned_lure_type = "none"
-                # If still none, choose a regular non-target letter
-                if planned_lure_type == "none":
-                    candidates = [c for c in LETTERS]
-                    if i >= n_back:
-                        avoid = seq[i - n_back]
-                        candidates = [c for c in candidates if c != avoid]
-                    if seq:
-                        last = seq[-1]
-                        if last in candidates and not _valid_run_limit(seq, last, max_identical_run - 1):
-                            candidates = [c for c in candidates if c != last]
-                    letter = _choose_letter(candidates, freqs, soft_balance=soft_balance_initial)
-                is_target_flags.append(0)
-                lure_types.append(planned_lure_type)
-
-            # Final run-limit check adjustment
-            if not _valid_run_limit(seq, letter, max_identical_run):
-                # Pick a different non-conflicting letter
-                cands = [c for c in LETTERS if _valid_run_limit(seq, c, max_identical_run)]
-                if i >= n_back:
-                    cands = [c for c in cands if c != (seq[i - n_back] if i >= n_back else None)]
-                if seq:
-                    last = seq[-1]
-                    if last in cands and not _valid_run_limit(seq, last, max_identical_run - 1):
-                        cands = [c for c in cands if c != last]
-                letter = _choose_letter(cands, freqs, soft_balance=soft_balance_initial)
-
-            seq.append(letter)
-            freqs[letter] = freqs.get(letter, 0) + 1
-
-        ok, _reason = validate_sequence(
-            seq, is_target_flags, lure_types,
-            n_back=n_back,
-            target_rate=target_rate,
-            tolerance=1,
-            max_consec_targets=max_consec_targets,
-        )
-        if not ok:
-            continue
-
-        plans: List[TrialPlan] = []
-        for i in range(n_trials):
-            iti_ms = random.randint(iti_range_ms[0], iti_range_ms[1])
-            plans.append(TrialPlan(
-                stimulus=seq[i],
-                is_target=is_target_flags[i],
-                lure_type=lure_types[i],
-                iti_ms=iti_ms,
-            ))
-        return plans
-
-    return generate_sequence(
-        n_back,
-        n_trials,
+                      include_lures: bool = True,
+                      seed: Optional[int] = None,
+                      rng: Optional[_RandomSource] = None) -> List[TrialPlan]:
+    """Generate a constrained N-back sequence of n_trials TrialPlans.
+    Draws from rng if given, otherwise from the module-level random state.
+    With seed, a private random.Random(seed) is used instead, so seeded
+    sequences are reproducible.
+    """
+    if seed is not None and rng is not None:
+        raise ValueError("Pass either seed or rng, not both")
+    params = dict(
         target_rate=target_rate,
         lure_n_minus_1_rate=lure_n_minus_1_rate,
         lure_n_plus_1_rate=lure_n_plus_1_rate,
         max_consec_targets=max_consec_targets,
         max_identical_run=max_identical_run,
-        iti_range_ms=iti_range_ms,
-        max_attempts=1,
-        soft_balance_initial=False,
+        iti_range_ms=tuple(iti_range_ms),
+        max_attempts=max_attempts,
+        soft_balance_initial=soft_balance_initial,
         include_lures=include_lures,
     )
+    if seed is not None:
+        return _generate(random.Random(seed), n_back, n_trials, **params)
+    if SEQ_WORKERS > 1:
+        return _generate_parallel(rng or random, SEQ_WORKERS, n_back, n_trials, **params)
+    return _generate(rng or random, n_back, n_trials, **params)
+
+
+def _generate_parallel(rng: _RandomSource, workers: int, n_back: int, n_trials: int,
+                       *, max_attempts: int, **params) -> List[TrialPlan]:
+    # Split the attempt budget over worker processes, each with its own seed
+    # drawn from rng. The first success in submission order wins, so the result
+    # depends only on rng's state, not on which worker finishes first.
+    worker_attempts = -(-max_attempts // workers)
+    seeds = [rng.getrandbits(64) for _ in range(workers)]
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [
+            executor.submit(_generate_seeded_worker, s, n_back, n_trials,
+                            max_attempts=worker_attempts, **params)
+            for s in seeds
+        ]
+        for fut in futures:
+            try:
+                return fut.result()
+            except ValueError:
+                continue
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    raise ValueError(
+        f"Could not generate a valid {n_back}-back sequence of {n_trials} trials "
+        f"in {2 * worker_attempts * workers} attempts; relax the sequence constraints"
+    )
+
+
+def _generate_seeded_worker(seed: int, n_back: int, n_trials: int, **params) -> List[TrialPlan]:
+    return _generate(random.Random(seed), n_back, n_trials, **params)
+
+
+def _generate(rng: _RandomSource, n_back: int, n_trials: int, *,
+              target_rate: float,
+              lure_n_minus_1_rate: float,
+              lure_n_plus_1_rate: float,
+              max_consec_targets: int,
+              max_identical_run: int,
+              iti_range_ms: Tuple[int, int],
+              max_attempts: int,
+              soft_balance_initial: bool,
+              include_lures: bool) -> List[TrialPlan]:
+    tolerance = 1  # allowed deviation from the desired target count
+    desired_targets = round(target_rate * n_trials)
+    # Run-length caps; a non-positive limit means "no limit" (n_trials is never reached)
+    run_cap = max_identical_run if max_identical_run > 0 else n_trials
+    # ITIs do not depend on the letter sequence: draw them once, in one batch
+    iti_lo, iti_hi = iti_range_ms
+    itis = rng.choices(range(iti_lo, iti_hi + 1), k=n_trials)
+
+    # Soft letter balancing first; if that keeps failing, retry without it
+    for soft_balance in (soft_balance_initial, False):
+        for _attempt in range(1, max_attempts + 1):
+            built = _build_attempt(
+                rng, n_back, n_trials, desired_targets,
+                lure_n_minus_1_rate=lure_n_minus_1_rate,
+                lure_n_plus_1_rate=lure_n_plus_1_rate,
+                max_consec_targets=max_consec_targets,
+                tolerance=tolerance,
+                run_cap=run_cap,
+                soft_balance=soft_balance,
+                include_lures=include_lures,
+            )
+            if built is None:
+                continue
+            seq, is_target_flags, lure_codes, n_targets = built
+            lure_types = [_LURE_NAMES[c] for c in lure_codes]
+
+            if __debug__:
+                # _build_attempt only returns valid sequences; re-check outside -O runs
+                ok, reason = validate_sequence(
+                    seq, is_target_flags, lure_types,
+                    n_back=n_back,
+                    target_rate=target_rate,
+                    tolerance=tolerance,
+                    max_consec_targets=max_consec_targets,
+                    total_targets=n_targets,
+                )
+                assert ok, reason
+
+            return [
+                TrialPlan(
+                    stimulus=LETTERS[seq[i]],
+                    is_target=is_target_flags[i],
+                    lure_type=lure_types[i],
+                    iti_ms=itis[i],
+                    marker_code=MARK_STIM_TARGET if is_target_flags[i] else _LURE_MARKERS[lure_codes[i]],
+                )
+                for i in range(n_trials)
+            ]
+
+    raise ValueError(
+        f"Could not generate a valid {n_back}-back sequence of {n_trials} trials "
+        f"in {2 * max_attempts} attempts; relax the sequence constraints"
+    )
@@ -12,13 +12,16 @@ from __future__ import annotations
 
 import os
 import sys
-import csv
 import random
-import string
 import argparse
+import functools
 import json
+import math
+import operator
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Dict, Optional, Tuple
+from typing import IO, List, Dict, Optional, Tuple
 from datetime import datetime
 
 from psychopy import core, visual, event, gui
@@ -27,21 +30,29 @@ try:
     _HAVE_HW_KB = True
 except Exception:
     _HAVE_HW_KB = False
+# Optional C JSON serializer for the metadata sidecar; stdlib json otherwise
+try:
+    import orjson
+    _HAVE_ORJSON = True
+except ImportError:
+    _HAVE_ORJSON = False
 from nback.markers import (
     ENABLE_MARKERS,
     MARK_CONSENT_SHOWN,
     MARK_BLOCK_START,
     MARK_FIXATION_ONSET,
-    MARK_STIM_TARGET,
-    MARK_STIM_NONTARGET,
-    MARK_STIM_LURE_N_MINUS_1,
-    MARK_STIM_LURE_N_PLUS_1,
     MARK_RESPONSE_REGISTERED,
     MARK_BLOCK_END,
     MARK_THANK_YOU,
     send_marker,
 )
 from nback.sequences import (
+    ITI_JITTER_RANGE_MS,
+    LETTERS,
+    LURE_N_MINUS_1_RATE,
+    LURE_N_PLUS_1_RATE,
+    MAX_CONSEC_TARGETS_DEFAULT,
+    TARGET_RATE,
     TrialPlan,
     generate_sequence,
 )
@@ -61,27 +72,14 @@ PRACTICE_HAS_LURES = False
 # Practice passing criterion (fraction correct)
 PRACTICE_PASS_ACC = 0.75
 
-# Stimulus set
-EXCLUDE_CONFUSABLES = True  # Exclude I/O/Q if True
-LETTERS = [c for c in string.ascii_uppercase]
-if EXCLUDE_CONFUSABLES:
-    LETTERS = [c for c in LETTERS if c not in {"I", "O", "Q"}]
+# Stimulus set (LETTERS, A-Z without I/O/Q) and sequence constraints
+# (TARGET_RATE, lure rates, run/consecutive caps, ITI jitter) come from nback.sequences.
 
 # Timing (ms)
 FIXATION_DUR_MS = 500
 STIM_DUR_MS = 500
 RESP_WINDOW_MS = 1500  # measured from stimulus onset
-ITI_JITTER_RANGE_MS = (500, 900)  # inclusive bounds for uniform jitter; CLI can override
-
-# Sequence constraints
-TARGET_RATE = 0.30
-LURE_N_MINUS_1_RATE = 0.05
-LURE_N_PLUS_1_RATE = 0.05
-MAX_IDENTICAL_RUN = 2  # cap identical-letter runs unless needed for target/lure
-MAX_ATTEMPTS = 300
-
-# Default limit on consecutive targets (can be overridden via CLI)
-MAX_CONSEC_TARGETS_DEFAULT = 1
+POLL_INTERVAL_S = 0.001  # keyboard polling interval during the response window
 
 # Visuals
 BACKGROUND_COLOR = [0.2, 0.2, 0.2]  # gray
@@ -95,12 +93,28 @@ KEY_PROCEED = "return"
 KEY_RESPONSE = "space"
 KEY_QUIT = "escape"
 
-"""Markers are imported from nback.markers."""
-
 # Paths
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 TEXTS_DIR = os.path.join(os.path.dirname(__file__), "texts")
 CONSENT_FILE = os.path.join(TEXTS_DIR, "informed_consent.txt")
+# Measured refresh rates per display, so startup skips getActualFrameRate
+REFRESH_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "nback", "refresh.json")
+# Cached rates outside this range (Hz) are ignored and remeasured
+REFRESH_HZ_RANGE = (20.0, 500.0)
+# A cached rate is reused only if a few timed flips agree with it within this fraction
+REFRESH_CHECK_TOLERANCE = 0.05
+
+# CSV columns; TrialRow.to_csv_line writes values in this order. Lines are
+# written directly (no csv module): no field can contain a comma or quote, since
+# participant IDs pass through safe_filename and every other field is a number
+# or a fixed token. "\r\n" matches the csv module's default line terminator.
+CSV_FIELDNAMES = (
+    "participant_id", "session_timestamp", "block_idx", "trial_idx",
+    "n_back", "stimulus", "is_target", "lure_type", "iti_ms",
+    "stim_onset_time", "response_key", "rt_ms", "correct",
+    "marker_code_stim", "marker_code_resp",
+)
+CSV_HEADER = ",".join(CSV_FIELDNAMES) + "\r\n"
 
 # Runtime configuration (set from CLI in main())
 CFG_TARGET_RATE = TARGET_RATE
@@ -108,11 +122,19 @@ CFG_LURE_NM1 = LURE_N_MINUS_1_RATE
 CFG_LURE_NP1 = LURE_N_PLUS_1_RATE
 CFG_MAX_CONSEC_TARGETS = MAX_CONSEC_TARGETS_DEFAULT
 CFG_ITI_RANGE_MS = ITI_JITTER_RANGE_MS
+# End the response window as soon as a response is registered (after the stimulus
+# has been shown for STIM_DUR_MS). Off by default: the window is fixed-length.
+CFG_EARLY_EXIT_ON_RESPONSE = False
 
-# Pre-created stimuli (initialized after window creation)
-STIM_LETTER: Optional[visual.TextStim] = None
+# Pre-created stimuli (initialized after window creation): one TextStim per letter
+# so trials never re-layout text, plus the fixation cross
+STIM_LETTERS: Dict[str, visual.TextStim] = {}
 STIM_FIXATION: Optional[visual.TextStim] = None
 
+# Frame duration in ms (set in main() once the refresh rate is detected). When
+# known, timed screens count frames instead of reading a clock every flip.
+FRAME_MS: Optional[float] = None
+
 
 # =========================
 # Utilities
@@ -126,31 +148,87 @@ def timestamp() -> str:
     return datetime.now().strftime("%Y%m%d_%H%M%S")
 
 
-def safe_filename(name: str) -> str:
-    return "".join(c for c in name if c.isalnum() or c in ("-", "_", ".")).strip()
+def _refresh_cache_key(win: visual.Window, screen: Optional[int], fullscr: bool) -> str:
+    """Identify a display by screen index, window size in pixels and fullscreen mode,
+    plus the physical screen's geometry and OS-reported mode rate where pyglet exposes them.
+    """
+    width, height = (int(v) for v in win.size)
+    parts = [f"screen={screen}", f"{width}x{height}", "fullscr" if fullscr else "windowed"]
+    try:
+        pyscreen = win.winHandle.screen
+        parts.append(f"at={pyscreen.x},{pyscreen.y}:{pyscreen.width}x{pyscreen.height}")
+        mode_rate = getattr(pyscreen.get_mode(), "rate", None)
+        if mode_rate:
+            parts.append(f"mode={mode_rate}Hz")
+    except Exception:
+        pass
+    return "|".join(parts)
 
 
-# =========================
-"""Marker plumbing now lives in nback/markers.py; send_marker is imported."""
+def _valid_refresh_hz(value: object) -> Optional[float]:
+    """value as a refresh rate if it is a finite number within REFRESH_HZ_RANGE, else None."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    hz = float(value)
+    lo, hi = REFRESH_HZ_RANGE
+    return hz if math.isfinite(hz) and lo <= hz <= hi else None
 
 
-# =========================
-# Sequence generation
-# =========================
+def _refresh_matches(win: visual.Window, refresh_hz: float, n_flips: int = 12) -> bool:
+    """Time a few flips and check their median period against refresh_hz."""
+    try:
+        win.flip()
+        stamps = [win.flip() for _ in range(n_flips + 1)]
+    except Exception:
+        return False
+    if any(t is None for t in stamps):
+        return False
+    periods = sorted(b - a for a, b in zip(stamps, stamps[1:]))
+    period_s = periods[len(periods) // 2]
+    return abs(period_s * refresh_hz - 1.0) <= REFRESH_CHECK_TOLERANCE
 
-"""TrialPlan dataclass is imported from nback.sequences."""
 
+def _load_refresh_cache(path: str = REFRESH_CACHE_PATH) -> Dict[str, float]:
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _store_refresh_cache(key: str, refresh_hz: float, path: str = REFRESH_CACHE_PATH) -> None:
+    """Record a measured refresh rate. Written to a temp file and swapped in with
+    os.replace so a crash never leaves a truncated cache behind."""
+    cache = _load_refresh_cache(path)
+    cache[key] = float(refresh_hz)
+    tmp_path = path + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(cache, fh, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: Could not write refresh cache {path}: {e}")
 
-# Sequence helpers are imported from nback.sequences
 
+class _FilenameCharTable(dict):
+    """str.translate table keeping alphanumerics and "-_.", deleting everything else.
+    Entries are filled on first lookup, so no table over all of Unicode is built.
+    """
 
-# ...existing code...
+    def __missing__(self, code: int) -> Optional[int]:
+        c = chr(code)
+        keep = code if c.isalnum() or c in "-_." else None
+        self[code] = keep
+        return keep
 
 
-# Validation is imported from nback.sequences
+_FILENAME_TABLE = _FilenameCharTable()
 
 
-"""Sequence generation moved to nback.sequences.generate_sequence."""
+def safe_filename(name: str) -> str:
+    return name.translate(_FILENAME_TABLE).strip()
 
 
 # =========================
@@ -194,7 +272,7 @@ def show_consent(win: visual.Window, text_stim: Optional[visual.TextStim] = None
     while True:
         keys = event.waitKeys(keyList=[KEY_PROCEED, KEY_QUIT])
         if KEY_QUIT in keys:
-            graceful_quit(None, None, [], win, abort=True)
+            graceful_quit(win, abort=True)
         if KEY_PROCEED in keys:
             break
 
@@ -209,13 +287,18 @@ INSTR_PRACTICE_PASS_FILE = os.path.join(TEXTS_DIR, "instructions_practice_feedba
 INSTR_PRACTICE_FAIL_FILE = os.path.join(TEXTS_DIR, "instructions_practice_feedback_fail.txt")
 
 
-def _load_text(path: str, fallback: str) -> str:
+@functools.lru_cache(maxsize=32)
+def _read_text(path: str) -> str:
+    """Stripped file contents, or "" if unreadable. Texts do not change during a session."""
     try:
         with open(path, "r", encoding="utf-8") as f:
-            txt = f.read().strip()
-            return txt if txt else fallback
+            return f.read().strip()
     except Exception:
-        return fallback
+        return ""
+
+
+def _load_text(path: str, fallback: str) -> str:
+    return _read_text(path) or fallback
 
 
 def show_instructions(win: visual.Window, n_back: int) -> None:
@@ -227,7 +310,7 @@ def show_instructions(win: visual.Window, n_back: int) -> None:
     while True:
         keys = event.waitKeys(keyList=[KEY_PROCEED, KEY_QUIT])
         if KEY_QUIT in keys:
-            graceful_quit(None, None, [], win, abort=True)
+            graceful_quit(win, abort=True)
         if KEY_PROCEED in keys:
             break
 
@@ -257,7 +340,7 @@ def _make_autosized_text(
     shrink_factor: float = 0.9,
     align: str = 'left',  # 'left' or 'center'
 ) -> visual.TextStim:
-    """Create a TextStim that automatically shrinks until it fits the vertical space.
+    """Create a TextStim sized to fit the vertical space, without drawing it.
 
     Parameters:
         win: PsychoPy Window (units='height').
@@ -265,13 +348,20 @@ def _make_autosized_text(
         start_height: Initial character height (in 'height' units).
         min_height: Lower bound for shrinking.
         max_height_frac: Fraction of window pixel height allowed for bounding box.
-        shrink_factor: Multiplicative factor applied per iteration when too tall.
+        shrink_factor: Minimum shrink applied per correction when still too tall.
     """
     wrap_w = _default_wrap_width(win)
-    h = start_height
     if align not in {'left','center'}:
         align = 'left'
     anchor_h = 'center'
+    # Estimate the wrapped height up front ('height' units: the window is 1.0
+    # tall). Glyphs average ~0.55 h wide and lines are ~1.2 h apart. The block
+    # height grows with h squared (more lines, each taller), hence the sqrt.
+    h = start_height
+    n_lines = sum(max(1, math.ceil(len(line) * 0.55 * h / wrap_w)) for line in text.split("\n"))
+    est_h = n_lines * 1.2 * h
+    if est_h > max_height_frac:
+        h = max(min_height, h * math.sqrt(max_height_frac / est_h))
     stim = visual.TextStim(
         win,
         text=text,
@@ -284,23 +374,16 @@ def _make_autosized_text(
         anchorVert='center',
     )
 
-    # Iteratively shrink until bounding box fits within desired vertical fraction.
-    # boundingBox returns (w, h) in pixels, or None if not yet drawable.
+    # Correct the estimate from the measured layout. boundingBox returns (w, h)
+    # in pixels, or None if unavailable, in which case the estimate stands.
     try:
-        while True:
+        limit_px = win.size[1] * max_height_frac
+        for _ in range(3):
             bb = getattr(stim, 'boundingBox', None)
-            if not bb:
-                # Draw once to establish metrics
-                stim.draw(); win.flip(); core.wait(0.01)
-                bb = getattr(stim, 'boundingBox', None)
-            if not bb:
-                break
-            bb_h = bb[1] if isinstance(bb, (list, tuple)) and len(bb) > 1 else 0
-            if bb_h <= win.size[1] * max_height_frac:
-                break
-            h *= shrink_factor
-            if h < min_height:
+            bb_h = bb[1] if bb is not None and len(bb) > 1 else 0
+            if not bb_h or bb_h <= limit_px or h <= min_height:
                 break
+            h = max(min_height, h * min(shrink_factor, math.sqrt(limit_px / bb_h)))
             stim.height = h
     except Exception:
         pass  # Fail gracefully; keep last size
@@ -315,7 +398,7 @@ def show_practice_headsup(win: visual.Window) -> None:
     while True:
         keys = event.waitKeys(keyList=[KEY_PROCEED, KEY_QUIT])
         if KEY_QUIT in keys:
-            graceful_quit(None, None, [], win, abort=True)
+            graceful_quit(win, abort=True)
         if KEY_PROCEED in keys:
             break
 
@@ -332,7 +415,7 @@ def show_break(win: visual.Window, block_idx: int, acc: float, mean_rt: Optional
     while True:
         keys = event.waitKeys(keyList=[KEY_PROCEED, KEY_QUIT])
         if KEY_QUIT in keys:
-            graceful_quit(None, None, [], win, abort=True)
+            graceful_quit(win, abort=True)
         if KEY_PROCEED in keys:
             break
 
@@ -340,8 +423,9 @@ def show_break(win: visual.Window, block_idx: int, acc: float, mean_rt: Optional
 def show_thanks(win: visual.Window) -> None:
     text = _load_text(INSTR_THANKS_FILE, "Thank you!") + "\n"
     stim = _make_autosized_text(win, text, start_height=0.09, align='center')
-    stim.draw(); win.flip()
-    send_marker(MARK_THANK_YOU, {"event": "thank_you"})
+    stim.draw()
+    win.callOnFlip(send_marker, MARK_THANK_YOU, {"event": "thank_you"})
+    win.flip()
     core.wait(1.5)
 
 
@@ -358,7 +442,27 @@ def show_save_and_exit_prompt(win: visual.Window) -> None:
             break
 
 
-def run_practice(win: visual.Window, n_back: int, practice_trials: int) -> Tuple[float, Optional[float]]:
+def generate_block_plans(n_back: int, n_blocks: int, trials_per_block: int,
+                         rng: random.Random) -> List[List[TrialPlan]]:
+    """Every main block's sequence, drawn in block order from rng."""
+    return [
+        generate_sequence(
+            n_back,
+            trials_per_block,
+            target_rate=CFG_TARGET_RATE,
+            lure_n_minus_1_rate=CFG_LURE_NM1,
+            lure_n_plus_1_rate=CFG_LURE_NP1,
+            max_consec_targets=CFG_MAX_CONSEC_TARGETS,
+            iti_range_ms=CFG_ITI_RANGE_MS,
+            include_lures=True,
+            rng=rng,
+        )
+        for _ in range(n_blocks)
+    ]
+
+
+def run_practice(win: visual.Window, n_back: int, practice_trials: int,
+                 rng: Optional[random.Random] = None) -> Tuple[float, Optional[float]]:
     plans = generate_sequence(
         n_back,
         practice_trials,
@@ -368,13 +472,12 @@ def run_practice(win: visual.Window, n_back: int, practice_trials: int) -> Tuple
         max_consec_targets=CFG_MAX_CONSEC_TARGETS,
         iti_range_ms=CFG_ITI_RANGE_MS,
         include_lures=PRACTICE_HAS_LURES,
+        rng=rng,
     )
     accs: List[int] = []
     rts: List[float] = []
-    _ = run_block(win, block_idx=0, n_back=n_back, plans=plans, is_practice=True,
-                  accs_out=accs, rts_out=rts, rows_out=None)
-    acc = sum(accs) / len(accs) if accs else 0.0
-    mean_rt = (sum(rts) / len(rts)) if rts else None
+    acc, mean_rt = run_block(win, block_idx=0, n_back=n_back, plans=plans, is_practice=True,
+                             accs_out=accs, rts_out=rts, csv_file=None)
 
     # Feedback
     passed = acc >= PRACTICE_PASS_ACC
@@ -391,7 +494,7 @@ def run_practice(win: visual.Window, n_back: int, practice_trials: int) -> Tuple
     while True:
         keys = event.waitKeys(keyList=[KEY_PROCEED, KEY_QUIT])
         if KEY_QUIT in keys:
-            graceful_quit(None, None, [], win, abort=True)
+            graceful_quit(win, abort=True)
         if KEY_PROCEED in keys:
             break
     return acc, mean_rt
@@ -406,34 +509,56 @@ def show_task_headsup(win: visual.Window, n_back: int) -> None:
     while True:
         keys = event.waitKeys(keyList=[KEY_PROCEED, KEY_QUIT])
         if KEY_QUIT in keys:
-            graceful_quit(None, None, [], win, abort=True)
+            graceful_quit(win, abort=True)
         if KEY_PROCEED in keys:
             break
 
 
 def _ensure_stims(win: visual.Window) -> None:
-    global STIM_LETTER, STIM_FIXATION
-    if STIM_LETTER is None:
-        STIM_LETTER = visual.TextStim(win, text="", color=TEXT_COLOR, font=FONT, height=FONT_HEIGHT)
+    global STIM_FIXATION
+    created = False
+    if not STIM_LETTERS:
+        for letter in LETTERS:
+            STIM_LETTERS[letter] = visual.TextStim(win, text=letter, color=TEXT_COLOR, font=FONT, height=FONT_HEIGHT)
+        created = True
     if STIM_FIXATION is None:
         STIM_FIXATION = visual.TextStim(win, text="+", color=TEXT_COLOR, font=FONT, height=FIXATION_HEIGHT)
-
-
-def _draw_fixation(win: visual.Window) -> None:
-    _ensure_stims(win)
-    assert STIM_FIXATION is not None
-    STIM_FIXATION.draw()
-
-
-def _draw_stimulus(win: visual.Window, letter: str) -> None:
-    _ensure_stims(win)
-    assert STIM_LETTER is not None
-    STIM_LETTER.text = letter
-    STIM_LETTER.draw()
-
-
-def _flip_for_ms(win: visual.Window, duration_ms: int, draw_fn=None) -> None:
-    """Flip each frame for duration_ms, optionally drawing via draw_fn before each flip."""
+        created = True
+    if created:
+        # Draw each new stim once into the back buffer so glyph textures are
+        # uploaded now rather than on a letter's first trial; the buffer is
+        # cleared without flipping, so nothing reaches the screen
+        for stim in STIM_LETTERS.values():
+            stim.draw()
+        STIM_FIXATION.draw()
+        win.clearBuffer()
+
+
+def _frames_for_ms(duration_ms: float) -> Optional[int]:
+    """Whole frames closest to duration_ms (at least one), or None if the refresh rate is unknown."""
+    if FRAME_MS is None:
+        return None
+    return max(1, round(duration_ms / FRAME_MS))
+
+
+def _flip_for_ms(win: visual.Window, duration_ms: int, draw_fn=None,
+                 n_frames: Optional[int] = None) -> None:
+    """Flip each frame for duration_ms, optionally drawing via draw_fn before each flip.
+    Flips a fixed frame count (n_frames, or derived from FRAME_MS) when available,
+    otherwise until a clock passes duration_ms.
+    """
+    if n_frames is None:
+        n_frames = _frames_for_ms(duration_ms)
+    if n_frames is not None:
+        flip = win.flip
+        if draw_fn is None:
+            for _ in range(n_frames):
+                flip()
+        else:
+            for _ in range(n_frames):
+                draw_fn()
+                flip()
+        return
     clk = core.Clock(); clk.reset()
     while True:
         if draw_fn is not None:
@@ -443,21 +568,52 @@ def _flip_for_ms(win: visual.Window, duration_ms: int, draw_fn=None) -> None:
             break
 
 
-def _marker_code_for_stim(is_target: int, lure_type: str) -> int:
-    if is_target:
-        return MARK_STIM_TARGET
-    if lure_type == "n-1":
-        return MARK_STIM_LURE_N_MINUS_1
-    if lure_type == "n+1":
-        return MARK_STIM_LURE_N_PLUS_1
-    return MARK_STIM_NONTARGET
+@dataclass(slots=True)
+class TrialRow:
+    """One trial's CSV record, kept raw during the block and formatted at write time."""
+    participant_id: str
+    session_timestamp: str
+    block_idx: int
+    trial_idx: int
+    n_back: int
+    stimulus: str
+    is_target: int
+    lure_type: str
+    iti_ms: int
+    stim_onset_time: float
+    response_key: Optional[str]
+    rt_ms: Optional[float]
+    correct: int
+    marker_code_stim: int
+    marker_code_resp: Optional[int]
+
+    def csv_prefix(self) -> str:
+        """The leading participant/session/block fields, shared by a block's rows."""
+        return f"{self.participant_id},{self.session_timestamp},{self.block_idx},"
+
+    def to_csv_line(self, prefix: Optional[str] = None) -> str:
+        """The row as one CSV line, fields in CSV_FIELDNAMES order. Pass a block's
+        csv_prefix() to skip re-formatting the fields that are the same on every row.
+        """
+        if prefix is None:
+            prefix = self.csv_prefix()
+        rt = f"{self.rt_ms:.2f}" if self.rt_ms is not None else ""
+        resp_code = self.marker_code_resp if self.marker_code_resp is not None else ""
+        return (
+            f"{prefix}{self.trial_idx},"
+            f"{self.n_back},{self.stimulus},{self.is_target},{self.lure_type},{self.iti_ms},"
+            f"{self.stim_onset_time:.6f},{self.response_key or ''},{rt},{self.correct},"
+            f"{self.marker_code_stim},{resp_code}\r\n"
+        )
 
 
 def run_block(win: visual.Window, block_idx: int, n_back: int, plans: List[TrialPlan],
               is_practice: bool, accs_out: List[int], rts_out: List[float],
-              rows_out: Optional[List[Dict]]) -> Tuple[float, Optional[float]]:
-    # Start marker
-    send_marker(MARK_BLOCK_START, {"event": "block_start", "n_back": n_back, "block_idx": block_idx})
+              csv_file: Optional[IO[str]]) -> Tuple[float, Optional[float]]:
+    # Start marker, fired by the block's first flip (the first fixation onset).
+    # Markers tied to a screen change go through callOnFlip so they are sent at
+    # the flip itself rather than after it returns.
+    win.callOnFlip(send_marker, MARK_BLOCK_START, {"event": "block_start", "n_back": n_back, "block_idx": block_idx})
 
     # Use hardware keyboard when available for better timing
     kb = None
@@ -467,126 +623,164 @@ def run_block(win: visual.Window, block_idx: int, n_back: int, plans: List[Trial
         except Exception:
             kb = None
 
+    # Marker payloads are reused across trials; only the per-trial fields change
+    fix_info = {"event": "fixation_onset", "block_idx": block_idx, "trial_idx": 0}
+    stim_info = {"event": "stimulus_onset", "block_idx": block_idx, "trial_idx": 0,
+                 "is_target": 0, "lure_type": "none", "stimulus": ""}
+
+    # Loop invariants bound once per block; the response loop polls at ~1 kHz
+    use_hw_kb = _HAVE_HW_KB and kb is not None
+    wait = core.wait
+    poll_s = POLL_INTERVAL_S
+    key_list = [KEY_RESPONSE, KEY_QUIT]
+    early_exit = CFG_EARLY_EXIT_ON_RESPONSE
+
+    # Key poller picked once per block: returns (key, rt_ms) of the first pressed
+    # key, or None. RTs are relative to the trial's onset-aligned response clock.
+    if use_hw_kb:
+        get_hw_keys = kb.getKeys
+        clear_keys = kb.clearEvents
+
+        def poll(clock: core.Clock) -> Optional[Tuple[str, float]]:
+            keys = get_hw_keys(keyList=key_list, waitRelease=False, clear=False)
+            if keys:
+                k = keys[0]
+                return k.name, (k.rt or 0.0) * 1000.0
+            return None
+    else:
+        get_sw_keys = event.getKeys
+        clear_keys = event.clearEvents
+
+        def poll(clock: core.Clock) -> Optional[Tuple[str, float]]:
+            for k, t in get_sw_keys(keyList=key_list, timeStamped=clock):
+                if k:
+                    return k, t * 1000.0
+            return None
+
+    # Phase ends in integer ns after stimulus onset: stimulus off, then response
+    # window closed. With a known refresh rate the blanking flip is requested half
+    # a frame early so it lands on the frame closest to STIM_DUR_MS.
+    stim_off_ms = STIM_DUR_MS - FRAME_MS / 2.0 if FRAME_MS is not None else STIM_DUR_MS
+    phase_ends_ns = (round(stim_off_ms * 1_000_000), RESP_WINDOW_MS * 1_000_000)
+    # Onset timestamp (perf_counter_ns), recorded by the stimulus flip
+    perf_ns = time.perf_counter_ns
+    onset_ns = [0]
+
+    def _mark_onset() -> None:
+        onset_ns[0] = perf_ns()
+
     # Trial loop
     correct_count = 0
-    rt_list: List[float] = []
+    rows: List[TrialRow] = []
+    # Running sum/count of correct-response RTs for the block mean
+    rt_sum = 0.0
+    rt_count = 0
+
+    # Stimuli exist from here on; draw through bound methods, no per-frame checks
+    _ensure_stims(win)
+    assert STIM_FIXATION is not None
+    _draw_fix = STIM_FIXATION.draw
+    stim_letters = STIM_LETTERS
+    fix_frames = _frames_for_ms(FIXATION_DUR_MS)
+    iti_frames = [_frames_for_ms(p.iti_ms) for p in plans]
 
     for t_idx, plan in enumerate(plans, start=1):
+        is_target = plan.is_target
         # Fixation (frame-synced)
-        def _draw_fix():
-            _draw_fixation(win)
-        send_marker(MARK_FIXATION_ONSET, {"event": "fixation_onset", "block_idx": block_idx, "trial_idx": t_idx})
-        _flip_for_ms(win, FIXATION_DUR_MS, draw_fn=_draw_fix)
-
-        # Stimulus
-        _draw_stimulus(win, plan.stimulus)
+        fix_info["trial_idx"] = t_idx
+        win.callOnFlip(send_marker, MARK_FIXATION_ONSET, fix_info)
+        _flip_for_ms(win, FIXATION_DUR_MS, draw_fn=_draw_fix, n_frames=fix_frames)
+
+        # Stimulus; its marker payload is filled in before the onset flip
+        stim_info.update(trial_idx=t_idx, is_target=is_target,
+                         lure_type=plan.lure_type, stimulus=plan.stimulus)
+        stim_letters[plan.stimulus].draw()
         # Prepare response clock aligned with the stimulus flip
         resp_clock = core.Clock()
         win.callOnFlip(resp_clock.reset)
-        if _HAVE_HW_KB and kb is not None:
+        win.callOnFlip(_mark_onset)
+        stim_marker = plan.marker_code
+        win.callOnFlip(send_marker, stim_marker, stim_info)
+        if use_hw_kb:
             kb.clock = resp_clock
-            kb.clearEvents()
+        # Drop presses from before onset (only the active backend's queue)
+        clear_keys()
         stim_onset = win.flip()
-        stim_marker = _marker_code_for_stim(plan.is_target, plan.lure_type)
-        send_marker(stim_marker, {
-            "event": "stimulus_onset",
-            "block_idx": block_idx,
-            "trial_idx": t_idx,
-            "is_target": plan.is_target,
-            "lure_type": plan.lure_type,
-            "stimulus": plan.stimulus,
-        })
 
         # Response collection
         got_response = False
         resp_key = None
         rt_ms: Optional[float] = None
 
-        # Present for STIM_DUR_MS, then blank until RESP_WINDOW_MS
-        while True:
-            now_ms = resp_clock.getTime() * 1000.0
-            if now_ms >= RESP_WINDOW_MS:
-                break
-            if _HAVE_HW_KB and kb is not None:
-                keys = kb.getKeys(keyList=[KEY_RESPONSE, KEY_QUIT], waitRelease=False, clear=False)
-                if keys and not got_response:
-                    k = keys[0]
-                    name = k.name
-                    if name == KEY_QUIT:
-                        graceful_quit(None, None, rows_out if rows_out is not None else [], win, abort=True)
-                    got_response = True
-                    resp_key = name
-                    rt_ms = (k.rt or 0.0) * 1000.0
-                    send_marker(MARK_RESPONSE_REGISTERED, {
-                        "event": "response_registered",
-                        "block_idx": block_idx,
-                        "trial_idx": t_idx,
-                        "key": name,
-                        "rt_ms": rt_ms,
-                    })
-            else:
-                keys = event.getKeys(keyList=[KEY_RESPONSE, KEY_QUIT], timeStamped=resp_clock)
-                if keys and not got_response:
-                    for k, t in keys:
-                        if k == KEY_QUIT:
-                            graceful_quit(None, None, rows_out if rows_out is not None else [], win, abort=True)
-                        if k:
-                            got_response = True
-                            resp_key = k
-                            rt_ms = t * 1000.0
-                            send_marker(MARK_RESPONSE_REGISTERED, {
-                                "event": "response_registered",
-                                "block_idx": block_idx,
-                                "trial_idx": t_idx,
-                                "key": k,
-                                "rt_ms": rt_ms,
-                            })
-                            break
-            # After STIM_DUR_MS, clear screen but keep collecting
-            if now_ms >= STIM_DUR_MS:
+        # The stimulus stays on screen from the onset flip (no redraws) until
+        # STIM_DUR_MS; one flip then blanks it. Keys are polled until RESP_WINDOW_MS.
+        # resp_clock still timestamps the keys; the loop itself compares integer ns
+        for phase_idx, phase_end_ns in enumerate(phase_ends_ns):
+            deadline_ns = onset_ns[0] + phase_end_ns
+            while perf_ns() < deadline_ns:
+                if got_response and early_exit and phase_idx == 1:
+                    break
+                if not got_response:
+                    hit = poll(resp_clock)
+                    if hit is not None:
+                        resp_key, rt_ms = hit
+                        if resp_key == KEY_QUIT:
+                            graceful_quit(win, abort=True)
+                        got_response = True
+                        send_marker(MARK_RESPONSE_REGISTERED, {
+                            "event": "response_registered",
+                            "block_idx": block_idx,
+                            "trial_idx": t_idx,
+                            "key": resp_key,
+                            "rt_ms": rt_ms,
+                        })
+                wait(poll_s, hogCPUperiod=poll_s)
+            if phase_idx == 0:
                 win.flip()  # blank
-            else:
-                _draw_stimulus(win, plan.stimulus)
-                win.flip()
 
         # Score
         is_space = (resp_key == KEY_RESPONSE)
-        correct = int((plan.is_target == 1 and is_space) or (plan.is_target == 0 and not is_space))
+        correct = int((is_target == 1 and is_space) or (is_target == 0 and not is_space))
         if correct:
             correct_count += 1
         accs_out.append(correct)
         if correct and rt_ms is not None:
             rts_out.append(rt_ms)
-
-        # Row output
-        if rows_out is not None:
-            row = {
-                "participant_id": CURRENT_PARTICIPANT,
-                "session_timestamp": SESSION_TS,
-                "block_idx": block_idx,
-                "trial_idx": t_idx,
-                "n_back": n_back,
-                "stimulus": plan.stimulus,
-                "is_target": plan.is_target,
-                "lure_type": plan.lure_type,
-                "iti_ms": plan.iti_ms,
-                "stim_onset_time": f"{stim_onset:.6f}",
-                "response_key": resp_key or "",
-                "rt_ms": f"{rt_ms:.2f}" if rt_ms is not None else "",
-                "correct": correct,
-                "marker_code_stim": stim_marker,
-                "marker_code_resp": MARK_RESPONSE_REGISTERED if got_response else "",
-            }
-            rows_out.append(row)
-
-    # ITI (frame-synced blank)
-    _flip_for_ms(win, plan.iti_ms)
+            rt_sum += rt_ms
+            rt_count += 1
+
+        # Row output; formatted and written once the block is over
+        if csv_file is not None:
+            rows.append(TrialRow(
+                CURRENT_PARTICIPANT,
+                SESSION_TS,
+                block_idx,
+                t_idx,
+                n_back,
+                plan.stimulus,
+                is_target,
+                plan.lure_type,
+                plan.iti_ms,
+                stim_onset,
+                resp_key,
+                rt_ms,
+                correct,
+                stim_marker,
+                MARK_RESPONSE_REGISTERED if got_response else None,
+            ))
+
+        # ITI (frame-synced blank)
+        _flip_for_ms(win, plan.iti_ms, n_frames=iti_frames[t_idx - 1])
 
     # End marker
     send_marker(MARK_BLOCK_END, {"event": "block_end", "block_idx": block_idx})
 
+    if csv_file is not None and rows:
+        prefix = rows[0].csv_prefix()
+        csv_file.write("".join([row.to_csv_line(prefix) for row in rows]))
+
     acc = correct_count / len(plans) if plans else 0.0
-    mean_rt = (sum(rt_list) / len(rt_list)) if rt_list else (sum(rts_out) / len(rts_out) if rts_out else None)
+    mean_rt = rt_sum / rt_count if rt_count else None
     return acc, mean_rt
 
 
@@ -599,39 +793,32 @@ SESSION_TS = ""
 CSV_PATH = ""
 ABORT_WITHOUT_SAVE = False
 META_PATH = ""
+# Open session CSV (set in main()); graceful_quit closes it
+CSV_FILE: Optional[IO[str]] = None
 
 
-def graceful_quit(writer: Optional[csv.DictWriter], f: Optional[object], rows: List[Dict], win: Optional[visual.Window], abort: bool = False) -> None:
-    """Exit the task. If abort is True (e.g., ESC pressed), don't save and delete any CSV file."""
-    global ABORT_WITHOUT_SAVE
+def graceful_quit(win: Optional[visual.Window], abort: bool = False) -> None:
+    """Exit the task. If abort is True (e.g., ESC pressed), don't save and delete any CSV file.
+    Rows are written per block, so closing the open CSV saves everything recorded so far.
+    """
+    global ABORT_WITHOUT_SAVE, CSV_FILE
     ABORT_WITHOUT_SAVE = ABORT_WITHOUT_SAVE or abort
 
-    # Only save when not aborting
-    if not ABORT_WITHOUT_SAVE:
+    # Close the CSV (flushing buffered rows) before any removal
+    if CSV_FILE is not None:
         try:
-            if writer is not None and f is not None and rows:
-                writer.writerows(rows)
-                f.flush()
+            CSV_FILE.close()
         except Exception:
             pass
-    # Close file handle if present
-    try:
-        if f is not None:
-            f.close()
-    except Exception:
-        pass
-    # If aborting, remove CSV/metadata files if they exist
+        CSV_FILE = None
+    # If aborting, remove CSV/metadata files
     if ABORT_WITHOUT_SAVE:
-        try:
-            if CSV_PATH and os.path.exists(CSV_PATH):
-                os.remove(CSV_PATH)
-        except Exception:
-            pass
-        try:
-            if META_PATH and os.path.exists(META_PATH):
-                os.remove(META_PATH)
-        except Exception:
-            pass
+        for path in (CSV_PATH, META_PATH):
+            if path:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
     # Close window
     try:
         if win is not None:
@@ -645,29 +832,43 @@ def graceful_quit(writer: Optional[csv.DictWriter], f: Optional[object], rows: L
 # Main
 # =========================
 
-def main(argv: Optional[List[str]] = None) -> int:
-    global CURRENT_PARTICIPANT, SESSION_TS, CSV_PATH, META_PATH
+# Command-line options as (flags, add_argument keyword arguments), in --help order
+_CLI_OPTIONS: Tuple[Tuple[Tuple[str, ...], dict], ...] = (
+    (("--participant", "-p"), dict(default="anon", help="Participant ID")),
+    (("--n-back",), dict(type=int, default=N_BACK_DEFAULT, help="N for N-back (1, 2, 3)")),
+    (("--blocks",), dict(type=int, default=N_BLOCKS, help="Number of blocks")),
+    (("--trials",), dict(type=int, default=TRIALS_PER_BLOCK, help="Trials per block")),
+    (("--no-practice",), dict(action="store_true", help="Skip practice")),
+    (("--practice-trials",), dict(type=int, default=PRACTICE_TRIALS, help="Number of practice trials")),
+    (("--iti-min",), dict(type=int, default=ITI_JITTER_RANGE_MS[0], help="Minimum ITI jitter in ms")),
+    (("--iti-max",), dict(type=int, default=ITI_JITTER_RANGE_MS[1], help="Maximum ITI jitter in ms")),
+    (("--lure-nminus1",), dict(type=float, default=LURE_N_MINUS_1_RATE, help="Probability of n-1 lures per non-target trial")),
+    (("--lure-nplus1",), dict(type=float, default=LURE_N_PLUS_1_RATE, help="Probability of n+1 lures per non-target trial")),
+    (("--target-rate",), dict(type=float, default=TARGET_RATE, help="Target rate (0-1) per block")),
+    (("--max-consec-targets",), dict(type=int, default=MAX_CONSEC_TARGETS_DEFAULT, help="Maximum allowed consecutive targets")),
+    (("--seed",), dict(type=int, default=None, help="Random seed for reproducibility")),
+    (("--fsync-per-block",), dict(action="store_true", help="Flush and fsync the CSV after every block (default: once at session end)")),
+    (("--early-exit-on-response",), dict(action="store_true", help="End the response window once a response is registered (default: fixed-length window)")),
+    # Default to full-screen; allow windowed mode for debugging
+    (("--windowed",), dict(action="store_true", help="Run windowed for debugging (default: fullscreen)")),
+    (("--screen",), dict(type=int, default=None, help="Display/screen index (0=primary). If unset, PsychoPy default is used.")),
+    (("--list-screens",), dict(action="store_true", help="List detected screens and exit.")),
+    (("--remeasure-refresh",), dict(action="store_true", help="Measure the refresh rate even if a cached value exists for this display")),
+)
+
 
+@functools.lru_cache(maxsize=1)
+def _build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="PsychoPy N-back Task")
-    parser.add_argument("--participant", "-p", default="anon", help="Participant ID")
-    parser.add_argument("--n-back", type=int, default=N_BACK_DEFAULT, help="N for N-back (1, 2, 3)")
-    parser.add_argument("--blocks", type=int, default=N_BLOCKS, help="Number of blocks")
-    parser.add_argument("--trials", type=int, default=TRIALS_PER_BLOCK, help="Trials per block")
-    parser.add_argument("--no-practice", action="store_true", help="Skip practice")
-    parser.add_argument("--practice-trials", type=int, default=PRACTICE_TRIALS, help="Number of practice trials")
-    # New controls
-    parser.add_argument("--iti-min", type=int, default=ITI_JITTER_RANGE_MS[0], help="Minimum ITI jitter in ms")
-    parser.add_argument("--iti-max", type=int, default=ITI_JITTER_RANGE_MS[1], help="Maximum ITI jitter in ms")
-    parser.add_argument("--lure-nminus1", type=float, default=LURE_N_MINUS_1_RATE, help="Probability of n-1 lures per non-target trial")
-    parser.add_argument("--lure-nplus1", type=float, default=LURE_N_PLUS_1_RATE, help="Probability of n+1 lures per non-target trial")
-    parser.add_argument("--target-rate", type=float, default=TARGET_RATE, help="Target rate (0-1) per block")
-    parser.add_argument("--max-consec-targets", type=int, default=MAX_CONSEC_TARGETS_DEFAULT, help="Maximum allowed consecutive targets")
-    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducibility")
-    # Default to full-screen; allow windowed mode for debugging
-    parser.add_argument("--windowed", action="store_true", help="Run windowed for debugging (default: fullscreen)")
-    parser.add_argument("--screen", type=int, default=None, help="Display/screen index (0=primary). If unset, PsychoPy default is used.")
-    parser.add_argument("--list-screens", action="store_true", help="List detected screens and exit.")
-    args = parser.parse_args(argv)
+    for flags, kwargs in _CLI_OPTIONS:
+        parser.add_argument(*flags, **kwargs)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    global CURRENT_PARTICIPANT, SESSION_TS, CSV_PATH, META_PATH, CSV_FILE, FRAME_MS
+
+    args = _build_parser().parse_args(argv)
 
     # Optional screen enumeration (no window creation yet)
     if args.list_screens:
@@ -715,12 +916,12 @@ def main(argv: Optional[List[str]] = None) -> int:
     CURRENT_PARTICIPANT = safe_filename(str(args.participant)) or "anon"
     SESSION_TS = timestamp()
 
-    # Configure RNG
-    if args.seed is not None:
-        random.seed(int(args.seed))
+    # One generator for the whole session: practice and block sequences draw from
+    # it in order, so --seed reproduces the session without touching global state
+    session_rng = random.Random(None if args.seed is None else int(args.seed))
 
     # Apply CLI config
-    global CFG_TARGET_RATE, CFG_LURE_NM1, CFG_LURE_NP1, CFG_MAX_CONSEC_TARGETS, CFG_ITI_RANGE_MS
+    global CFG_TARGET_RATE, CFG_LURE_NM1, CFG_LURE_NP1, CFG_MAX_CONSEC_TARGETS, CFG_ITI_RANGE_MS, CFG_EARLY_EXIT_ON_RESPONSE
     CFG_TARGET_RATE = float(max(0.0, min(1.0, args.target_rate)))
     CFG_LURE_NM1 = float(max(0.0, min(1.0, args.lure_nminus1)))
     CFG_LURE_NP1 = float(max(0.0, min(1.0, args.lure_nplus1)))
@@ -728,6 +929,7 @@ def main(argv: Optional[List[str]] = None) -> int:
     iti_min = max(0, int(args.iti_min))
     iti_max = max(iti_min, int(args.iti_max))
     CFG_ITI_RANGE_MS = (iti_min, iti_max)
+    CFG_EARLY_EXIT_ON_RESPONSE = bool(args.early_exit_on_response)
 
     make_data_dir(DATA_DIR)
     csv_name = f"nback_{CURRENT_PARTICIPANT}_{SESSION_TS}.csv"
@@ -750,34 +952,60 @@ def main(argv: Optional[List[str]] = None) -> int:
         win.waitBlanking = True
     except Exception:
         pass
+    # Build trial stimuli up front rather than on the first trial
+    _ensure_stims(win)
 
-    # Detect and report display refresh rate
+    # Detect and report display refresh rate. Measuring takes a few seconds, so
+    # the result is cached per display; --remeasure-refresh forces a new measurement.
+    # Windowed (debug) runs skip it: their timing is not calibrated anyway.
     refresh_hz = None
-    try:
-        refresh_hz = win.getActualFrameRate(nIdentical=20, nMaxFrames=240, nWarmUpFrames=20, threshold=1)
-    except Exception:
-        refresh_hz = None
+    refresh_source = None
+    if not args.windowed:
+        refresh_key = _refresh_cache_key(win, args.screen, fullscr)
+        if not args.remeasure_refresh:
+            # A cached rate sets every frame count, so it must be plausible and
+            # agree with a quick flip timing on the display as it is now
+            refresh_hz = _valid_refresh_hz(_load_refresh_cache().get(refresh_key))
+            if refresh_hz and not _refresh_matches(win, refresh_hz):
+                print(f"Cached display refresh ({refresh_hz:.3f} Hz) does not match this display; remeasuring.")
+                refresh_hz = None
+        refresh_source = "cache" if refresh_hz else "measured"
+        if not refresh_hz:
+            try:
+                refresh_hz = win.getActualFrameRate(nIdentical=20, nMaxFrames=240, nWarmUpFrames=20, threshold=1)
+            except Exception:
+                refresh_hz = None
+            refresh_hz = _valid_refresh_hz(refresh_hz)
+            if refresh_hz:
+                _store_refresh_cache(refresh_key, refresh_hz)
     if refresh_hz:
-        print(f"Detected display refresh: {refresh_hz:.3f} Hz (frame ≈ {1000.0/refresh_hz:.2f} ms)")
+        FRAME_MS = 1000.0 / refresh_hz
+        print(f"Detected display refresh: {refresh_hz:.3f} Hz (frame ≈ {1000.0/refresh_hz:.2f} ms, {refresh_source})")
+    elif args.windowed:
+        print("Windowed (debug) mode: skipping refresh rate detection; timed screens use the clock.")
     else:
         print("Warning: Could not detect display refresh rate; proceeding without it.")
 
+    # Generate the main blocks' sequences on a worker thread while the consent and
+    # instruction screens wait for the participant; the result is collected before
+    # practice, so generation never overlaps timed trials. The blocks draw from their
+    # own generator, seeded from the session one, so --seed reproduces them
+    # regardless of thread timing.
+    block_rng = random.Random(session_rng.getrandbits(64))
+    plan_executor = ThreadPoolExecutor(max_workers=1)
+    block_plans_future = plan_executor.submit(generate_block_plans, n_back, n_blocks, trials_per_block, block_rng)
+    plan_executor.shutdown(wait=False)
+
     # Consent -> Instructions -> Practice heads up
     show_consent(win)
     show_instructions(win, n_back)
     show_practice_headsup(win)
+    block_plans = block_plans_future.result()
 
-    # Prepare CSV
-    fieldnames = [
-        "participant_id", "session_timestamp", "block_idx", "trial_idx",
-        "n_back", "stimulus", "is_target", "lure_type", "iti_ms",
-        "stim_onset_time", "response_key", "rt_ms", "correct",
-        "marker_code_stim", "marker_code_resp",
-    ]
-
-    f = open(CSV_PATH, "w", newline="", encoding="utf-8")
-    writer = csv.DictWriter(f, fieldnames=fieldnames)
-    writer.writeheader()
+    # Prepare CSV. A 64 KiB buffer batches the per-block writes, so the task
+    # never waits on disk.
+    f = CSV_FILE = open(CSV_PATH, "w", newline="", encoding="utf-8", buffering=65536)
+    f.write(CSV_HEADER)
 
     # Write sidecar metadata JSON for reproducibility (includes display refresh and fullscreen)
     try:
@@ -795,10 +1023,12 @@ def main(argv: Optional[List[str]] = None) -> int:
             "lure_nplus1_rate": CFG_LURE_NP1,
             "max_consec_targets": CFG_MAX_CONSEC_TARGETS,
             "iti_ms_range": list(CFG_ITI_RANGE_MS),
+            "early_exit_on_response": CFG_EARLY_EXIT_ON_RESPONSE,
             "seed": args.seed,
             "letters": LETTERS,
             "psychopy_version": None,
             "display_refresh_hz": refresh_hz,
+            "display_refresh_source": refresh_source if refresh_hz else None,
             "window_fullscreen": bool(fullscr),
             "screen_index": args.screen,
         }
@@ -807,20 +1037,30 @@ def main(argv: Optional[List[str]] = None) -> int:
             meta["psychopy_version"] = getattr(psychopy, "__version__", None)
         except Exception:
             pass
-        with open(META_PATH, "w", encoding="utf-8") as mf:
-            json.dump(meta, mf, indent=2)
+        if _HAVE_ORJSON:
+            with open(META_PATH, "wb") as mf:
+                mf.write(orjson.dumps(meta, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+        else:
+            with open(META_PATH, "w", encoding="utf-8") as mf:
+                json.dump(meta, mf, indent=2)
     except Exception:
         pass
 
-    all_rows: List[Dict] = []
-    overall_accs: List[int] = []
-    overall_rts: List[float] = []
+    # Session totals, accumulated per block
+    overall_correct = 0
+    overall_rt_sum = 0.0
+    overall_rt_count = 0
+    # Summary counters for target/non-target accuracy
+    target_correct = 0
+    target_total = 0
+    nontarget_correct = 0
+    nontarget_total = 0
 
     # Practice loop with pass/fail
     practice_trials = max(1, int(args.practice_trials))
     if not args.no_practice and practice_trials > 0:
         while True:
-            acc, _ = run_practice(win, n_back, practice_trials)
+            acc, _ = run_practice(win, n_back, practice_trials, rng=session_rng)
             if acc >= PRACTICE_PASS_ACC:
                 break
             # If failed, re-show very brief reminder before repeating
@@ -829,32 +1069,37 @@ def main(argv: Optional[List[str]] = None) -> int:
     # Heads-up before main task
     show_task_headsup(win, n_back)
 
-    # Blocks
-    for b in range(1, n_blocks + 1):
-        plans = generate_sequence(
-            n_back,
-            trials_per_block,
-            target_rate=CFG_TARGET_RATE,
-            lure_n_minus_1_rate=CFG_LURE_NM1,
-            lure_n_plus_1_rate=CFG_LURE_NP1,
-            max_consec_targets=CFG_MAX_CONSEC_TARGETS,
-            iti_range_ms=CFG_ITI_RANGE_MS,
-            include_lures=True,
-        )
-        block_accs: List[int] = []
-        block_rts: List[float] = []
+    # Blocks. The per-block outcome lists are allocated once and emptied before
+    # each block; their contents are folded into the running totals below.
+    block_accs: List[int] = []
+    block_rts: List[float] = []
+    for b, plans in enumerate(block_plans, start=1):
+        block_accs.clear()
+        block_rts.clear()
 
         acc, mean_rt = run_block(win, block_idx=b, n_back=n_back, plans=plans,
                                  is_practice=False, accs_out=block_accs, rts_out=block_rts,
-                                 rows_out=all_rows)
+                                 csv_file=f)
 
-        # Persist rows periodically (per block)
-        if all_rows:
-            writer.writerows(all_rows)
+        # run_block wrote the block's rows into the 64 KiB file buffer, which
+        # reaches disk when it fills or at the final flush, unless every block
+        # is to be made durable right away
+        if args.fsync_per_block:
             f.flush()
-            overall_accs.extend(block_accs)
-            overall_rts.extend([rt for rt in block_rts if rt is not None])
-            all_rows.clear()
+            os.fsync(f.fileno())
+        # Fold the block into the session totals: correct targets are the
+        # products of the 0/1 target flags and 0/1 correctness, the rest follow
+        block_correct = sum(block_accs)
+        block_targets = [p.is_target for p in plans]
+        block_target_correct = sum(map(operator.mul, block_targets, block_accs))
+        n_block_targets = sum(block_targets)
+        overall_correct += block_correct
+        overall_rt_sum += sum(block_rts)
+        overall_rt_count += len(block_rts)
+        target_total += n_block_targets
+        target_correct += block_target_correct
+        nontarget_total += len(block_accs) - n_block_targets
+        nontarget_correct += block_correct - block_target_correct
 
         # Break screen
         if b < n_blocks:
@@ -865,13 +1110,13 @@ def main(argv: Optional[List[str]] = None) -> int:
     # Require explicit save/exit confirmation (ENTER) and avoid ESC here
     show_save_and_exit_prompt(win)
 
-    # Final flush and close
+    # Final flush and close; fsync so the data is on disk before we report success
     try:
-        if all_rows:
-            writer.writerows(all_rows)
         f.flush()
+        os.fsync(f.fileno())
     finally:
         f.close()
+        CSV_FILE = None
 
     try:
         win.close()
@@ -880,33 +1125,10 @@ def main(argv: Optional[List[str]] = None) -> int:
 
     # Summary
     total_trials = n_blocks * trials_per_block
-    overall_acc = sum(overall_accs) / total_trials if total_trials else 0.0
-    # Accuracy by target/non-target requires re-reading CSV rows; quick pass
-    target_correct = 0
-    target_total = 0
-    nontarget_correct = 0
-    nontarget_total = 0
-
-    try:
-        with open(CSV_PATH, "r", encoding="utf-8") as rf:
-            r = csv.DictReader(rf)
-            for row in r:
-                itarget = int(row["is_target"]) if row["is_target"] != "" else 0
-                corr = int(row["correct"]) if row["correct"] != "" else 0
-                if itarget == 1:
-                    target_total += 1
-                    if corr == 1:
-                        target_correct += 1
-                else:
-                    nontarget_total += 1
-                    if corr == 1:
-                        nontarget_correct += 1
-    except Exception:
-        pass
-
+    overall_acc = overall_correct / total_trials if total_trials else 0.0
     target_acc = (target_correct / target_total) if target_total else 0.0
     nontarget_acc = (nontarget_correct / nontarget_total) if nontarget_total else 0.0
-    mean_rt = (sum(overall_rts) / len(overall_rts)) if overall_rts else None
+    mean_rt = overall_rt_sum / overall_rt_count if overall_rt_count else None
 
     print("\n===== Session Summary =====")
     print(f"File: {CSV_PATH}")
@@ -6,14 +6,17 @@ Run: python scripts/local_sequence_check.py
 from __future__ import annotations
 
 import sys
+from operator import attrgetter
+
 from nback.sequences import generate_sequence, validate_sequence
 
+# One C-level fetch of the three fields validate_sequence needs per plan
+_plan_fields = attrgetter("stimulus", "is_target", "lure_type")
+
 
 def check(n_back: int, trials: int = 40) -> None:
     plans = generate_sequence(n_back, trials)
-    seq = [p.stimulus for p in plans]
-    flags = [p.is_target for p in plans]
-    lures = [p.lure_type for p in plans]
+    seq, flags, lures = map(list, zip(*map(_plan_fields, plans)))
     ok, reason = validate_sequence(
         seq, flags, lures,
         n_back=n_back,
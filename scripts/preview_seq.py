@@ -1,16 +1,17 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import sys
-import random
+import argparse
 from nback.sequences import generate_sequence
 
-n = int(sys.argv[1]) if len(sys.argv) > 1 else 2
-trials = int(sys.argv[2]) if len(sys.argv) > 2 else 10
-seed = int(sys.argv[3]) if len(sys.argv) > 3 else None
-if seed is not None:
-    random.seed(seed)
-plans = generate_sequence(n, trials)
+parser = argparse.ArgumentParser(description="Preview a generated N-back sequence")
+parser.add_argument("n_back", nargs="?", type=int, default=2, help="N for N-back (default: 2)")
+parser.add_argument("trials", nargs="?", type=int, default=10, help="Number of trials (default: 10)")
+parser.add_argument("seed", nargs="?", type=int, default=None, help="Random seed for reproducibility")
+args = parser.parse_args()
+
+n, trials = args.n_back, args.trials
+plans = generate_sequence(n, trials, seed=args.seed)
 print('n_back:', n, 'trials:', trials)
 print('seq:       ', ''.join(p.stimulus for p in plans))
 print('is_target: ', [p.is_target for p in plans])
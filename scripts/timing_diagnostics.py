@@ -12,9 +12,9 @@ Usage:
 from __future__ import annotations
 
 import argparse
-from statistics import mean
 
-from psychopy import core, visual
+import numpy as np
+from psychopy import visual
 
 
 def main() -> int:
@@ -34,29 +34,31 @@ def main() -> int:
         win.flip()
 
     # Collect frame intervals and stats
-    fis = list(getattr(win, "frameIntervals", []))
+    fis = np.asarray(getattr(win, "frameIntervals", []), dtype=np.float64)
     try:
         refresh_hz = win.getActualFrameRate(nIdentical=20, nMaxFrames=240, nWarmUpFrames=20, threshold=1)
     except Exception:
         refresh_hz = None
 
+    # Close the window but don't core.quit() here: it exits the interpreter
+    # before the report below is printed
     win.close()
-    core.quit()
 
-    if not fis:
+    if not fis.size:
         print("No frame intervals recorded.")
         return 1
 
-    target = (1.0 / refresh_hz) if refresh_hz else mean(fis)
-    long = [x for x in fis if x > target * 1.25]  # >25% slower than nominal
+    mean_fi = float(fis.mean())
+    target = (1.0 / refresh_hz) if refresh_hz else mean_fi
+    n_long = int(np.count_nonzero(fis > target * 1.25))  # >25% slower than nominal
 
     print("=== Timing diagnostics ===")
-    print(f"Frames sampled: {len(fis)}")
+    print(f"Frames sampled: {fis.size}")
     if refresh_hz:
         print(f"Reported refresh rate: {refresh_hz:.3f} Hz (target frame ≈ {target*1000:.2f} ms)")
-    print(f"Mean frame interval: {mean(fis)*1000:.2f} ms")
-    print(f"Longest frame: {max(fis)*1000:.2f} ms")
-    print(f"Long frames (>125% of target): {len(long)}")
+    print(f"Mean frame interval: {mean_fi*1000:.2f} ms")
+    print(f"Longest frame: {float(fis.max())*1000:.2f} ms")
+    print(f"Long frames (>125% of target): {n_long}")
     print("==========================")
 
     return 0
@@ -0,0 +1,37 @@
+import pytest
+
+from nback.sequences import generate_sequence, validate_sequence
+
+
+def _validate(plans, n_back, target_rate=0.30, max_consec_targets=1):
+    return validate_sequence(
+        [p.stimulus for p in plans],
+        [p.is_target for p in plans],
+        [p.lure_type for p in plans],
+        n_back=n_back,
+        target_rate=target_rate,
+        tolerance=1,
+        max_consec_targets=max_consec_targets,
+    )
+
+
+@pytest.mark.parametrize("n_back", [2, 3])
+def test_short_block_generates(n_back):
+    """Five-trial blocks (the CONTRIBUTING smoke test) must not exhaust the attempts."""
+    for seed in range(20):
+        plans = generate_sequence(n_back, 5, seed=seed)
+        assert len(plans) == 5
+        ok, reason = _validate(plans, n_back)
+        assert ok, reason
+
+
+def test_mismatched_target_flag_fails_validation():
+    """A flag on a trial whose letter does not repeat n back is rejected, as is an unflagged repeat."""
+    kwargs = dict(n_back=2, target_rate=0.25, tolerance=1, max_consec_targets=1)
+    seq = ["A", "B", "A", "C", "D", "E", "F", "G"]
+    none = ["none"] * len(seq)
+    assert validate_sequence(seq, [0, 0, 1, 0, 0, 0, 0, 0], none, **kwargs) == (True, "ok")
+    # Target flag moved off the repeat: trial 2 repeats unflagged, trial 4 is flagged without a repeat
+    ok, reason = validate_sequence(seq, [0, 0, 0, 0, 1, 0, 0, 0], none, **kwargs)
+    assert not ok
+    assert reason == "Target flags do not match n-back repeats"